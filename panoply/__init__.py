@@ -1,12 +1,52 @@
+import importlib
 import logging
+import threading
 from sys import stdout
 from traceback import print_exception as _print_exception
 
-from .datasource import *
 from .records import *
 from .resources import *
-from .sdk import *
-from .ssh import SSHTunnel
+
+# heavy subsystems (requests, backoff, paramiko, sshtunnel) are imported
+# on first access of one of their attributes, see `__getattr__`
+_LAZY_ATTRIBUTES = {
+    "DataSource": "datasource",
+    "validate_token": "datasource",
+    "background_progress": "datasource",
+    "TokenValidationException": "errors",
+    "SDK": "sdk",
+    "MAXSIZE": "sdk",
+    "FLUSH_TIMEOUT": "sdk",
+    "SSHTunnel": "ssh",
+    "TransformPool": "transform",
+    "profiler": "profiling",
+    "BatchSizeTuner": "batching",
+    "read_batches": "batching",
+}
+
+_LAZY_MODULES = {
+    "batching", "constants", "datasource", "errors", "events", "load",
+    "profiling", "progress", "sdk", "ssh", "transform",
+}
+
+
+def __getattr__(name):
+    if name in _LAZY_ATTRIBUTES:
+        module = importlib.import_module(f".{_LAZY_ATTRIBUTES[name]}",
+                                         __name__)
+        value = getattr(module, name)
+    elif name in _LAZY_MODULES:
+        value = importlib.import_module(f".{name}", __name__)
+    else:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(_LAZY_ATTRIBUTES) | _LAZY_MODULES)
+
 
 logging.basicConfig(stream=stdout, format='%(levelname)s: %(message)s')
 
@@ -31,3 +71,14 @@ def custom_excepthook(args):
 
 
 threading.excepthook = custom_excepthook
+
+__all__ = [
+    # records
+    "Metadata", "Record", "RecordGroup", "to_record", "count_rows",
+    "validate_resource", "normalize_data", "get_iso_string",
+    # resources
+    "Field", "Resource", "convert_to_ui_format",
+    # submodules
+    "constants", "datasource", "errors", "events", "records", "resources",
+    "sdk", "ssh",
+] + list(_LAZY_ATTRIBUTES)
@@ -0,0 +1,133 @@
+"""
+    Adaptive `batch_size` for DataSource.read runs
+"""
+import json
+import os
+from time import perf_counter
+from typing import Optional
+
+from .records import count_rows
+
+# rows sampled from each batch to estimate the size of a row
+SAMPLE_ROWS = 10
+
+
+def process_memory() -> Optional[int]:
+    """
+    Current resident memory of the process in bytes,
+    or None where it's not available (non linux platforms).
+    """
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError, AttributeError):
+        return None
+
+
+def estimate_row_bytes(batch) -> int:
+    """ Average serialized size of the first rows of the batch """
+    rows = []
+    for item in batch:
+        if isinstance(item, dict) and isinstance(item.get("data"), list):
+            rows.extend(item["data"][:SAMPLE_ROWS - len(rows)])
+        elif isinstance(item, dict):
+            rows.append(item)
+        if len(rows) >= SAMPLE_ROWS:
+            break
+
+    if not rows:
+        return 0
+    size = sum(len(json.dumps(row, default=str)) for row in rows)
+    return size // len(rows)
+
+
+class BatchSizeTuner(object):
+    """
+    Picks the `batch_size` for the next `read` call from the measurements
+    of the previous one.
+
+    The batch size moves toward the number of rows that can be read within
+    `target_duration` seconds, and whose estimated size (`row_bytes` times
+    the batch size) fits into `memory_budget` bytes.
+
+    While the process memory is above `max_memory`, the batch size is
+    halved for batches that grew the memory, and otherwise kept as is:
+    python rarely returns freed memory to the OS, so a high but stable
+    memory is not a reason to keep shrinking.
+    Every step changes the batch size by a factor of 2 at most.
+    """
+
+    def __init__(self, batch_size=1000, min_batch_size=1,
+                 max_batch_size=100000, target_duration=5.0,
+                 memory_budget=256 * 1024 * 1024, max_memory=None):
+        self.batch_size = batch_size
+        self.min_batch_size = min_batch_size
+        self.max_batch_size = max_batch_size
+        self.target_duration = target_duration
+        self.memory_budget = memory_budget
+        self.max_memory = max_memory
+
+    def update(self, rows, duration, row_bytes=0, memory=None,
+               memory_growth=0):
+        """
+        Adjust the batch size after reading `rows` in `duration`, while the
+        process memory grew by `memory_growth` bytes up to `memory` bytes.
+        """
+        if rows <= 0:
+            return self.batch_size
+
+        target = rows * self.target_duration / max(duration, 1e-6)
+        if row_bytes:
+            target = min(target, self.memory_budget / row_bytes)
+        if self.max_memory and memory is not None and \
+                memory > self.max_memory:
+            if memory_growth > 0:
+                target = min(target, self.batch_size / 2)
+            else:
+                target = min(target, self.batch_size)
+
+        target = min(max(target, self.batch_size / 2), self.batch_size * 2)
+        self.batch_size = int(min(max(target, self.min_batch_size),
+                                  self.max_batch_size))
+        return self.batch_size
+
+
+def read_batches(source, tuner=None):
+    """
+    Read the `source` until it returns None, tuning `batch_size` between
+    the `read` calls, and yield the batches.
+
+    After every batch a `progress` event is fired with the measurements
+    and the chosen `batch_size`.
+    """
+    tuner = tuner or BatchSizeTuner()
+    while True:
+        batch_size = tuner.batch_size
+        memory_before = process_memory()
+        started = perf_counter()
+        batch = source.read(batch_size)
+        duration = perf_counter() - started
+        if batch is None:
+            return
+
+        rows = count_rows(batch)
+        row_bytes = estimate_row_bytes(batch)
+        memory = process_memory()
+        memory_growth = 0
+        if memory is not None and memory_before is not None:
+            memory_growth = memory - memory_before
+        tuner.update(rows, duration, row_bytes, memory, memory_growth)
+
+        source.fire('progress', {
+            'loaded': None,
+            'total': None,
+            'msg': f'Read {rows} rows in {duration:.2f} seconds, '
+                   f'next batch size is {tuner.batch_size}',
+            'rows': rows,
+            'duration': duration,
+            'row_bytes': row_bytes,
+            'memory': memory,
+            'memory_growth': memory_growth,
+            'batch_size': tuner.batch_size,
+        })
+        yield batch
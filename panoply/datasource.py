@@ -1,11 +1,9 @@
 import base64
-import concurrent.futures.thread
+import shutil
+import tempfile
 import traceback
 from abc import ABCMeta, abstractmethod
-from concurrent.futures import ThreadPoolExecutor
 from functools import wraps
-from threading import Event
-from time import time
 from typing import Dict, List, Union
 
 import backoff
@@ -13,9 +11,15 @@ import requests
 
 from . import events
 from .errors.exceptions import TokenValidationException
+from .profiling import profiler
+from .progress import watchdog
 from .records import RecordGroup
 from .resources import Resource
 
+# a multiple of 3, so the base64 encoded chunks concatenate
+# into the base64 encoding of the whole payload
+RAW_CHUNK_SIZE = 3 * 1024 * 1024
+
 
 class DataSource(events.Emitter, metaclass=ABCMeta):
     """ A base DataSource object """
@@ -82,6 +86,99 @@ class DataSource(events.Emitter, metaclass=ABCMeta):
             'metadata': metadata
         }
 
+    def raw_stream(self, tag, stream, metadata, chunk_size=RAW_CHUNK_SIZE,
+                   spool=False):
+        """
+        Create raw response objects for a large payload, chunk by chunk.
+
+        `stream` can be bytes, a binary file-like object or an iterable of
+        bytes chunks. Only a couple of chunks are held in memory at a time; every
+        raw object's metadata is extended with the `chunk` sequence number
+        and a `last` flag. With `spool`, the stream is first copied to a
+        temporary file, releasing the source (e.g. an HTTP connection) early.
+        """
+        if chunk_size <= 0 or chunk_size % 3:
+            raise ValueError("`chunk_size` should be a positive multiple of 3")
+
+        spooled = None
+        if spool and not isinstance(stream, (bytes, bytearray, memoryview)):
+            spooled = stream = _spool(stream, chunk_size)
+
+        return _raw_chunks(tag, stream, metadata, chunk_size, spooled)
+
+
+def _raw_chunks(tag, stream, metadata, chunk_size, spooled):
+    try:
+        chunks = _encoded_chunks(stream, chunk_size)
+        current = next(chunks, b'')
+        seq = 0
+        while current is not None:
+            following = next(chunks, None)
+            yield {
+                'type': 'raw',
+                'tag': tag,
+                'raw': current,
+                'metadata': dict(metadata, chunk=seq, last=following is None)
+            }
+            current = following
+            seq += 1
+    finally:
+        if spooled:
+            spooled.close()
+
+
+def _spool(stream, chunk_size):
+    spooled = tempfile.SpooledTemporaryFile(max_size=chunk_size)
+    if hasattr(stream, 'read'):
+        shutil.copyfileobj(stream, spooled, chunk_size)
+    else:
+        for piece in stream:
+            spooled.write(piece)
+    spooled.seek(0)
+    return spooled
+
+
+def _encoded_chunks(stream, chunk_size):
+    """ Yield base64 encoded `chunk_size` slices of the stream """
+    if isinstance(stream, (bytes, bytearray, memoryview)):
+        with memoryview(stream) as view, view.cast('B') as data:
+            for start in range(0, len(data), chunk_size):
+                yield base64.b64encode(data[start:start + chunk_size])
+        return
+
+    if hasattr(stream, 'readinto'):
+        # a single buffer is reused for the whole stream
+        buf = bytearray(chunk_size)
+        with memoryview(buf) as view:
+            while True:
+                size = 0
+                while size < chunk_size:
+                    read = stream.readinto(view[size:])
+                    if not read:
+                        break
+                    size += read
+                if size:
+                    yield base64.b64encode(view[:size])
+                if size < chunk_size:
+                    return
+
+    if hasattr(stream, 'read'):
+        stream = iter(lambda: stream.read(chunk_size), b'')
+
+    pending = bytearray()
+    for piece in stream:
+        pending += piece
+        if len(pending) < chunk_size:
+            continue
+        end = len(pending) - len(pending) % chunk_size
+        with memoryview(pending) as view:
+            for start in range(0, end, chunk_size):
+                yield base64.b64encode(view[start:start + chunk_size])
+        del pending[:end]
+
+    if pending:
+        yield base64.b64encode(pending)
+
 
 @backoff.on_exception(backoff.expo,
                       requests.exceptions.RequestException,
@@ -150,7 +247,8 @@ def validate_token(refresh_url, exceptions=(), callback=None,
                     token = self.source.get(refresh_key)
                     data = dict(self.options['refresh'],
                                 **{refresh_key: token})
-                    r = __send_request(refresh_url, data=data)
+                    r = profiler.call('validate_token.refresh',
+                                      __send_request, refresh_url, data=data)
                     self.source[access_key] = r.json()[access_key]
 
                     # save the new token in the database
@@ -184,13 +282,17 @@ def validate_token(refresh_url, exceptions=(), callback=None,
     return _validate_token
 
 
-def background_progress(message, waiting_interval=10 * 60, timeout=24*60*60):
+def background_progress(message, waiting_interval=10 * 60, timeout=24*60*60,
+                        cancel=None):
     """ A decorator is used to emit progress while long operation is executed.
         For example, for database's data sources such operations might be
         declaration of the cursor or counting number of rows.
         This decorator should only be used on methods that are waiting for
         input/output operations to be completed.
 
+        The operation runs in the caller's thread, while a single shared
+        watchdog thread emits the progress for all the running operations.
+
        Parameters
        ----------
        message : str
@@ -201,6 +303,17 @@ def background_progress(message, waiting_interval=10 * 60, timeout=24*60*60):
        timeout : float
            Time in seconds for maximum progress emiting time.
            Defaults to no 24 hours
+       cancel : str or callable
+           Called from the watchdog thread when `timeout` is exceeded, in
+           order to interrupt the operation (e.g. cancel a database cursor).
+           If the `cancel` is not `callable`, but an `str` it will be called
+           on `self`, otherwise it's called with `self` as an argument.
+           Once cancelled, "Max waiting time exceeded" is raised when the
+           operation returns; a cancel that is still pending when the
+           operation finishes is skipped. Without `cancel` the operation
+           can't be interrupted: exceeding the timeout is only logged, the
+           progress stops, and the result of the operation is returned.
+           Defaults to None
     """
 
     def _background_progress(func):
@@ -209,23 +322,38 @@ def background_progress(message, waiting_interval=10 * 60, timeout=24*60*60):
             self = args[0]
             self.log('Creating background progress emitter')
             self.log(f'Timeout is set to {timeout} seconds')
-            finished = Event()
-            started_at = time()
-            with ThreadPoolExecutor(max_workers=1) as executor:
-                func_future = executor.submit(func, *args, **kwargs)
-                func_future.add_done_callback(lambda future: finished.set())
-
-                while not func_future.done():
-                    if (time() - started_at) > timeout:
-                        self.log("Max waiting time exceeded. Clearing threads.")
-                        executor._threads.clear()
-                        concurrent.futures.thread._threads_queues.clear()
-                        raise Exception("Max waiting time exceeded")
-                    self.log(message)
-                    self.progress(None, None, message)
-                    finished.wait(timeout=waiting_interval)
-
-                return func_future.result()
+
+            def on_tick():
+                self.log(message)
+                self.progress(None, None, message)
+
+            def on_timeout():
+                if cancel is None:
+                    self.log("Max waiting time exceeded. "
+                             "Waiting for the operation to complete.")
+                    return
+                self.log("Max waiting time exceeded. Cancelling operation.")
+                if callable(cancel):
+                    cancel(self)
+                else:
+                    getattr(self, cancel)()
+
+            on_tick()
+            operation = watchdog.watch(on_tick, on_timeout,
+                                       waiting_interval, timeout)
+            try:
+                result = func(*args, **kwargs)
+            except Exception:
+                # only when the cancel ran before the operation finished
+                if watchdog.unwatch(operation) and cancel is not None:
+                    raise Exception("Max waiting time exceeded")
+                raise
+            finally:
+                watchdog.unwatch(operation)
+
+            if operation.timed_out and cancel is not None:
+                raise Exception("Max waiting time exceeded")
+            return result
 
         return wrapper
 
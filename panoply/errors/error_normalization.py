@@ -1,8 +1,8 @@
 from enum import Enum
 from functools import wraps
 
-import panoply.datasource
 from .exceptions import DataSourceException
+from ..profiling import profiler
 
 ERROR_CODES_REGISTRY = {
     400: 'Bad request',
@@ -55,7 +55,7 @@ def wrap_errors(phase: Phase) -> callable:
         @wraps(func)
         def wrapper(*args, **kwargs) -> list:
             try:
-                return func(*args, **kwargs)
+                return profiler.call(func.__qualname__, func, *args, **kwargs)
             except DataSourceException as e:
                 # In case of nested error wrapper we should keep the original
                 # error but with the phase value of the last error wrapper
@@ -65,8 +65,11 @@ def wrap_errors(phase: Phase) -> callable:
                 # source object can be:
                 # 1. a first param in dynamic params methods (e.g. definition(source, options))
                 # 2. an attribute of the DataSource class (e.g. definition(self, params) -> source = self.source)
+                # imported here to keep `requests` & co. out of `import panoply`
+                from ..datasource import DataSource
+
                 source_config = args[0]
-                if isinstance(source_config, panoply.datasource.DataSource):
+                if isinstance(source_config, DataSource):
                     source_config = getattr(source_config, 'source', None)
 
                 code = EXCEPTIONS_REGISTRY.get(type(e))
@@ -1,18 +1,133 @@
+import logging
+import queue
+import threading
+
+# placeholder for coalesced events, the latest data is kept aside
+_PENDING = object()
+
+
+class Dispatcher(object):
+    """
+    Runs event handlers on a background thread, off the firing thread.
+
+    Coalesced events (e.g. `progress`) are collapsed while waiting in the
+    queue, so only the latest data is handled.
+    A single dispatcher thread serves all the asynchronous emitters.
+    """
+
+    def __init__(self):
+        self._queue = queue.Queue()
+        self._pending = {}
+        # emitter -> number of its queued events that weren't handled yet
+        self._unfinished = {}
+        self._cond = threading.Condition()
+        self._thread = None
+
+    def put(self, emitter, name, data, coalesce=False):
+        self._ensure_thread()
+        with self._cond:
+            if coalesce:
+                key = (emitter, name)
+                queued = key in self._pending
+                self._pending[key] = data
+                if queued:
+                    return
+                data = _PENDING
+
+            self._unfinished[emitter] = self._unfinished.get(emitter, 0) + 1
+        self._queue.put((emitter, name, data))
+
+    def join(self, emitter):
+        """ Block until all the queued events of the emitter were handled """
+        with self._cond:
+            while emitter in self._unfinished:
+                self._cond.wait()
+
+    def _ensure_thread(self):
+        # the thread may not exist yet or be lost after a fork
+        if self._thread is not None and self._thread.is_alive():
+            return
+
+        with self._cond:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._loop,
+                                                name="events-dispatcher")
+                self._thread.daemon = True
+                self._thread.start()
+
+    def _loop(self):
+        while True:
+            emitter, name, data = self._queue.get()
+            try:
+                if data is _PENDING:
+                    with self._cond:
+                        data = self._pending.pop((emitter, name))
+                emitter._dispatch(name, data)
+            except Exception:
+                logging.exception("Failed to handle `%s` event", name)
+            finally:
+                with self._cond:
+                    self._unfinished[emitter] -= 1
+                    if not self._unfinished[emitter]:
+                        del self._unfinished[emitter]
+                        self._cond.notify_all()
+                # don't keep the last emitter alive while waiting
+                emitter = data = None
+
+
+# the dispatcher of all the asynchronous emitters
+dispatcher = Dispatcher()
+
+
 class Emitter(object):
     _events = None
+    _dispatcher = None
+    _coalesce = frozenset()
 
     def __init__(self):
+        # event name -> immutable tuple of handlers, replaced on every `on`
+        # so that `fire` can iterate without locking
         self._events = {}
+        self._events_lock = threading.Lock()
 
     def on(self, name, fn):
-        self._events.setdefault(name, set([])).add(fn)
+        with self._events_lock:
+            handlers = self._events.get(name, ())
+            if fn not in handlers:
+                self._events[name] = handlers + (fn,)
+        return self
+
+    def dispatch_async(self, coalesce=("progress",)):
+        """
+        Run the handlers of all the fired events on a background thread,
+        so that slow handlers don't stall the firing thread.
+        Handler errors are logged instead of raised to `fire` callers.
+
+        Events listed in `coalesce` are collapsed while waiting to be
+        handled, so only their latest data is handled.
+        """
+        self._coalesce = frozenset(coalesce)
+        self._dispatcher = dispatcher
+        return self
+
+    def join_events(self):
+        """ Wait for the asynchronously fired events to be handled """
+        if self._dispatcher is not None:
+            self._dispatcher.join(self)
         return self
 
     def fire(self, name, data):
-        for fn in self._events.get("*", set([])):
+        if self._dispatcher is not None:
+            self._dispatcher.put(self, name, data, name in self._coalesce)
+        else:
+            self._dispatch(name, data)
+
+        return self
+
+    def _dispatch(self, name, data):
+        events = self._events
+        for fn in events.get("*", ()):
             fn(name, data)
 
-        for fn in self._events.get(name, set([])):
+        for fn in events.get(name, ()):
             fn(data)
-
-        return self
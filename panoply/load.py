@@ -0,0 +1,269 @@
+"""
+    `panoply-load` - bulk load NDJSON / CSV files through the SDK
+"""
+import argparse
+import csv
+import gzip
+import json
+import mmap
+import os
+import sys
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from .sdk import SDK
+
+# records written to the SDK but not flushed yet, before readers wait
+MAX_PENDING = 100000
+
+
+def read_lines(path, offset=0):
+    """
+    Yield (end offset, line) for the lines of the file starting at `offset`.
+    Plain files are memory-mapped, gzipped ones are decompressed on the fly
+    and their offsets refer to the uncompressed data.
+    """
+    if path.endswith(".gz"):
+        with gzip.open(path, "rb") as f:
+            f.seek(offset)
+            for line in f:
+                offset += len(line)
+                yield offset, line
+        return
+
+    with open(path, "rb") as f:
+        size = os.fstat(f.fileno()).st_size
+        if offset >= size:
+            return
+
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            while offset < size:
+                end = mm.find(b"\n", offset)
+                end = size if end < 0 else end + 1
+                yield end, mm[offset:end]
+                offset = end
+
+
+def read_ndjson(path, offset=0):
+    """ Yield (end offset, record) for the NDJSON file """
+    for end, line in read_lines(path, offset):
+        if line.strip():
+            yield end, json.loads(line)
+
+
+def read_csv(path, offset=0, encoding="utf-8"):
+    """ Yield (end offset, record) for the CSV file, keyed by its header """
+    lines = read_lines(path)
+    try:
+        header_end, header = next(lines)
+    except StopIteration:
+        return
+    finally:
+        lines.close()
+
+    fields = next(csv.reader([header.decode(encoding)]))
+    position = {"end": max(offset, header_end)}
+
+    def decoded():
+        for end, line in read_lines(path, position["end"]):
+            position["end"] = end
+            yield line.decode(encoding)
+
+    # the csv reader consumes exactly the lines of each row, so the last
+    # consumed line's end is the offset of the row (quoted newlines included)
+    for row in csv.reader(decoded()):
+        if row:
+            yield position["end"], dict(zip(fields, row))
+
+
+READERS = {
+    "ndjson": read_ndjson,
+    "csv": read_csv,
+}
+
+
+def detect_format(path):
+    name = path[:-len(".gz")] if path.endswith(".gz") else path
+    return "csv" if name.endswith(".csv") else "ndjson"
+
+
+class Loader(object):
+    """
+    Streams files into a table through an `SDK` instance.
+
+    Offsets are committed per file only after the SDK flushed the records
+    that precede them, so `offsets` can be used to resume after a failure
+    without losing data. Readers wait while more than `max_pending` records
+    are waiting to be sent.
+    """
+
+    def __init__(self, sdk, table, key=None, fmt=None, max_pending=MAX_PENDING):
+        self.sdk = sdk
+        self.table = table
+        self.key = key
+        self.fmt = fmt
+        self.max_pending = max_pending
+        self.offsets = {}
+        self.error = None
+        self.written = 0
+        self.flushed = 0
+        self.bytes_read = 0
+        self._marks = deque()
+        self._cond = threading.Condition()
+
+        sdk.on("flush", self._on_flush)
+        sdk.on("error", self._on_error)
+
+    def load(self, path, offset=0):
+        reader = READERS[self.fmt or detect_format(path)]
+        last = offset
+        for end, record in reader(path, offset):
+            with self._cond:
+                while not self.error and \
+                        self.written - self.flushed >= self.max_pending:
+                    self._cond.wait()
+                if self.error:
+                    return
+
+                self.sdk.write(self.table, record, key=self.key)
+                self.written += 1
+                self.bytes_read += end - last
+                self._marks.append((self.written, path, end))
+                last = end
+
+        with self._cond:
+            # mark files that are read completely, even if empty
+            self._marks.append((self.written, path, last))
+            self._commit()
+
+    def wait(self):
+        """ Block until all the written records are flushed """
+        with self._cond:
+            while not self.error and self.flushed < self.written:
+                self._cond.wait()
+
+    def stop(self, error):
+        with self._cond:
+            self.error = self.error or error
+            self._cond.notify_all()
+
+    def _on_flush(self, data):
+        with self._cond:
+            # after a failed batch, later flushes don't make offsets safe
+            if self.error:
+                return
+
+            self.flushed += data.get("count") or 0
+            self._commit()
+            self._cond.notify_all()
+
+    def _on_error(self, err):
+        self.stop(err)
+
+    def _commit(self):
+        marks = self._marks
+        while marks and marks[0][0] <= self.flushed:
+            _, path, end = marks.popleft()
+            self.offsets[path] = end
+
+
+def _report(loader, started, out):
+    elapsed = max(time.time() - started, 1e-6)
+    print("read {} records ({:.1f} MB, {:.0f} records/s, {:.2f} MB/s), "
+          "sent {}".format(
+              loader.written, loader.bytes_read / 1e6,
+              loader.written / elapsed, loader.bytes_read / 1e6 / elapsed,
+              loader.flushed
+          ), file=out)
+
+
+def _save_state(path, offsets):
+    with open(path, "w") as f:
+        json.dump(offsets, f)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog="panoply-load",
+        description="Load NDJSON / CSV files (optionally gzipped) "
+                    "into a Panoply table"
+    )
+    parser.add_argument("table", help="destination table")
+    parser.add_argument("files", nargs="+", help="files to load")
+    parser.add_argument("--apikey", default=os.environ.get("PANOPLY_APIKEY"),
+                        help="defaults to $PANOPLY_APIKEY")
+    parser.add_argument("--apisecret",
+                        default=os.environ.get("PANOPLY_APISECRET"),
+                        help="defaults to $PANOPLY_APISECRET")
+    parser.add_argument("--format", choices=sorted(READERS),
+                        help="detected from the file extension by default")
+    parser.add_argument("--key", help="key field, compacts repeated records")
+    parser.add_argument("--offset", type=int, default=0,
+                        help="byte offset to resume a single file from")
+    parser.add_argument("--state",
+                        help="JSON file of per-file offsets, "
+                             "used to resume and updated on exit")
+    parser.add_argument("--jobs", type=int, default=1,
+                        help="number of files read in parallel")
+    parser.add_argument("--interval", type=float, default=10.0,
+                        help="seconds between progress reports")
+    args = parser.parse_args(argv)
+
+    if not args.apikey or not args.apisecret:
+        parser.error("--apikey and --apisecret are required")
+    if args.offset and len(args.files) > 1:
+        parser.error("--offset can only be used with a single file")
+
+    offsets = {path: args.offset for path in args.files}
+    if args.state and os.path.exists(args.state):
+        with open(args.state) as f:
+            offsets.update(json.load(f))
+
+    loader = Loader(SDK(args.apikey, args.apisecret), args.table,
+                    key=args.key, fmt=args.format)
+    loader.offsets.update(offsets)
+
+    started = time.time()
+    done = threading.Event()
+
+    def report():
+        while not done.wait(args.interval):
+            _report(loader, started, sys.stderr)
+
+    threading.Thread(target=report, daemon=True).start()
+
+    executor = ThreadPoolExecutor(max_workers=args.jobs)
+    try:
+        futures = [executor.submit(loader.load, path, offsets[path])
+                   for path in args.files]
+        for future in futures:
+            try:
+                future.result()
+            except Exception as err:
+                loader.stop(err)
+        loader.wait()
+    except KeyboardInterrupt as err:
+        loader.stop(err)
+    finally:
+        executor.shutdown()
+        done.set()
+
+    _report(loader, started, sys.stderr)
+    if args.state:
+        _save_state(args.state, loader.offsets)
+
+    if loader.error is None:
+        return 0
+
+    print("failed: {!r}".format(loader.error), file=sys.stderr)
+    for path in args.files:
+        print("resume {} with --offset {}".format(
+            path, loader.offsets.get(path, offsets[path])
+        ), file=sys.stderr)
+    return 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
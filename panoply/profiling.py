@@ -0,0 +1,282 @@
+"""
+    Opt-in instrumentation of Data Source entry points
+"""
+import cProfile
+import io
+import pstats
+import threading
+import tracemalloc
+import types
+from contextlib import contextmanager
+from time import perf_counter
+
+from . import events
+from .records import count_rows
+
+
+def _decoded_size(raw):
+    """ Size of the payload of a base64 encoded raw object """
+    padding = len(raw) - len(raw.rstrip(b"="))
+    return len(raw) // 4 * 3 - padding
+
+
+class CallStats(object):
+    """ Aggregated measurements of all the calls with the same name """
+
+    def __init__(self, name):
+        self.name = name
+        self.calls = 0
+        self.wall = 0.0
+        self.network = 0.0
+        self.rows = 0
+        self.bytes = 0
+        self.peak_memory = 0
+
+    @property
+    def python(self):
+        return self.wall - self.network
+
+    def add(self, call):
+        self.calls += 1
+        self.wall += call["wall"]
+        self.network += call["network"]
+        self.rows += call["rows"]
+        self.bytes += call["bytes"]
+        self.peak_memory = max(self.peak_memory, call.get("peak_memory", 0))
+
+
+class Profiler(events.Emitter):
+    """
+    Measures the wall time, the time spent waiting for the network,
+    and the rows & raw payload bytes (before base64 encoding)
+    returned by the profiled calls.
+
+    Disabled by default. Once enabled, every measured call fires
+    a `profile` event and is aggregated into `stats`, see `report()`.
+
+    Data Source methods decorated with `errors.wrap_errors` are measured
+    automatically. Network time is collected from `requests` calls and
+    from code wrapped with `profiler.network()`.
+
+    Rows & bytes are counted for list results. The items of a returned
+    generator (e.g. `raw_stream`) are produced while it's iterated, so
+    each of them is measured as a call of `<name> (iterated)`.
+
+    How to Use:
+
+        profiler.enable(cprofile=True)
+        ... run the source
+        print(profiler.report())
+    """
+
+    def __init__(self):
+        super(Profiler, self).__init__()
+        self.enabled = False
+        self.stats = {}
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._cprofile = None
+        # the cProfile of the last enabled session, kept for `report()`
+        self._last_cprofile = None
+        self._tracemalloc = False
+        self._unpatch = None
+
+    def enable(self, cprofile=False, memory=False, requests=True):
+        """
+        Start profiling.
+
+        Parameters
+        ----------
+        cprofile : bool
+            Collect cProfile statistics for the outermost calls
+            of the main thread.
+        memory : bool
+            Trace memory allocations with `tracemalloc` and record the peak
+            memory of every call.
+        requests : bool
+            Count the time spent in `requests` HTTP calls as network time.
+        """
+        self.disable()
+        if cprofile:
+            self._cprofile = cProfile.Profile()
+        if memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._tracemalloc = True
+        if requests:
+            self._patch_requests()
+
+        self.enabled = True
+        return self
+
+    def disable(self):
+        self.enabled = False
+        if self._cprofile:
+            self._last_cprofile = self._cprofile
+            self._cprofile = None
+        if self._tracemalloc:
+            # only stop tracing that was started by the profiler
+            tracemalloc.stop()
+            self._tracemalloc = False
+        if self._unpatch:
+            self._unpatch()
+            self._unpatch = None
+        return self
+
+    def reset(self):
+        with self._lock:
+            self.stats = {}
+        if self._cprofile:
+            self._cprofile = cProfile.Profile()
+        self._last_cprofile = None
+        return self
+
+    def call(self, name, func, *args, **kwargs):
+        """ Call `func` measuring it under `name` """
+        if not self.enabled:
+            return func(*args, **kwargs)
+
+        with self.measure(name) as call:
+            result = func(*args, **kwargs)
+            self._count(call, result)
+
+        # the items of generators (e.g. `raw_stream`) are produced, and
+        # measured, while the caller iterates them
+        if isinstance(result, types.GeneratorType):
+            return self._iterate(name + " (iterated)", result)
+        return result
+
+    @contextmanager
+    def measure(self, name):
+        """ Measure the enclosed block under `name` """
+        if not self.enabled:
+            yield None
+            return
+
+        frames = self._frames()
+        outermost = not frames
+        profile = self._cprofile
+        if outermost and profile and \
+                threading.current_thread() is threading.main_thread():
+            try:
+                profile.enable()
+            except ValueError:
+                # another profiler is already active
+                profile = None
+        else:
+            profile = None
+        # `reset_peak` is only available since python 3.9
+        if outermost and tracemalloc.is_tracing() and \
+                hasattr(tracemalloc, "reset_peak"):
+            tracemalloc.reset_peak()
+
+        call = {"name": name, "network": 0.0, "rows": 0, "bytes": 0}
+        frames.append(call)
+        started = perf_counter()
+        try:
+            yield call
+        finally:
+            call["wall"] = perf_counter() - started
+            call["python"] = call["wall"] - call["network"]
+            frames.pop()
+            if profile:
+                profile.disable()
+            if outermost and tracemalloc.is_tracing():
+                call["peak_memory"] = tracemalloc.get_traced_memory()[1]
+
+            with self._lock:
+                self.stats.setdefault(name, CallStats(name)).add(call)
+            self.fire("profile", call)
+
+    @contextmanager
+    def network(self):
+        """ Count the enclosed block as network time of the running calls """
+        frames = self._frames()
+        if not self.enabled or not frames or self._local.in_network:
+            yield
+            return
+
+        self._local.in_network = True
+        started = perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = perf_counter() - started
+            self._local.in_network = False
+            for frame in frames:
+                frame["network"] += elapsed
+
+    def report(self, top=20):
+        """ A human readable summary of the collected measurements """
+        lines = ["{:<40} {:>7} {:>10} {:>10} {:>10} {:>10} {:>12} {:>12}".format(
+            "name", "calls", "wall", "network", "python",
+            "rows", "bytes", "peak memory"
+        )]
+        with self._lock:
+            stats = sorted(self.stats.values(), key=lambda s: -s.wall)
+        for s in stats:
+            lines.append(
+                "{:<40} {:>7} {:>10.3f} {:>10.3f} {:>10.3f} {:>10} {:>12} {:>12}".format(
+                    s.name, s.calls, s.wall, s.network, s.python,
+                    s.rows, s.bytes, s.peak_memory
+                )
+            )
+
+        profile = self._cprofile or self._last_cprofile
+        if profile and profile.getstats():
+            out = io.StringIO()
+            pstats.Stats(profile, stream=out) \
+                .sort_stats("cumulative").print_stats(top)
+            lines.append(out.getvalue())
+
+        return "\n".join(lines)
+
+    def _frames(self):
+        local = self._local
+        if not hasattr(local, "frames"):
+            local.frames = []
+            local.in_network = False
+        return local.frames
+
+    def _iterate(self, name, items):
+        """ Yield the items, measuring the production of each under `name` """
+        try:
+            while True:
+                with self.measure(name) as call:
+                    try:
+                        item = next(items)
+                    except StopIteration:
+                        return
+                    if call is not None:
+                        self._count(call, [item])
+                yield item
+        finally:
+            items.close()
+
+    @staticmethod
+    def _count(call, result):
+        if not isinstance(result, list):
+            return
+
+        call["rows"] += count_rows(result)
+        call["bytes"] += sum(
+            _decoded_size(item.get("raw") or b"") for item in result
+            if isinstance(item, dict) and item.get("type") == "raw"
+        )
+
+    def _patch_requests(self):
+        try:
+            from requests.adapters import HTTPAdapter
+        except ImportError:
+            return
+
+        send = HTTPAdapter.send
+
+        def profiled_send(adapter, *args, **kwargs):
+            with self.network():
+                return send(adapter, *args, **kwargs)
+
+        HTTPAdapter.send = profiled_send
+        self._unpatch = lambda: setattr(HTTPAdapter, "send", send)
+
+
+profiler = Profiler()
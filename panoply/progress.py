@@ -0,0 +1,125 @@
+"""
+    Shared watchdog for long running operations
+"""
+import logging
+import threading
+from time import time
+
+
+# states of a watched operation
+RUNNING = "running"
+TIMING_OUT = "timing out"
+TIMED_OUT = "timed out"
+FINISHED = "finished"
+
+
+class Operation(object):
+    """ A long running operation watched by the `ProgressWatchdog` """
+
+    def __init__(self, on_tick, on_timeout, interval, timeout):
+        self.on_tick = on_tick
+        self.on_timeout = on_timeout
+        self.interval = interval
+        self.started_at = time()
+        self.next_tick = self.started_at + interval
+        self.deadline = self.started_at + timeout
+        self.state = RUNNING
+
+    @property
+    def timed_out(self):
+        """ Whether `on_timeout` completed before the operation finished """
+        return self.state == TIMED_OUT
+
+
+class ProgressWatchdog(object):
+    """
+    A single background ticker for all the in-flight long operations.
+
+    The operations themselves run in the caller's thread; the watchdog
+    only calls `on_tick` every `interval` seconds and `on_timeout` once
+    the operation runs longer than `timeout` seconds.
+    """
+
+    def __init__(self):
+        self._cond = threading.Condition()
+        self._operations = set()
+        self._thread = None
+
+    def watch(self, on_tick, on_timeout, interval, timeout):
+        operation = Operation(on_tick, on_timeout, interval, timeout)
+        with self._cond:
+            self._operations.add(operation)
+            # the thread may not exist yet or be lost after a fork
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._loop,
+                                                name="progress-watchdog")
+                self._thread.daemon = True
+                self._thread.start()
+            self._cond.notify()
+
+        return operation
+
+    def unwatch(self, operation):
+        """
+        Stop watching the finished operation, skipping a pending
+        `on_timeout`, or waiting for a running one to complete.
+        Returns whether the operation timed out.
+        """
+        with self._cond:
+            self._operations.discard(operation)
+            while operation.state == TIMING_OUT:
+                self._cond.wait()
+            if operation.state == RUNNING:
+                operation.state = FINISHED
+        return operation.timed_out
+
+    def _loop(self):
+        while True:
+            with self._cond:
+                now = time()
+                due = [op for op in self._operations
+                       if min(op.next_tick, op.deadline) <= now]
+                for op in due:
+                    if op.deadline <= now:
+                        self._operations.discard(op)
+                    else:
+                        op.next_tick = now + op.interval
+
+                if not due:
+                    wakeup = min((min(op.next_tick, op.deadline)
+                                  for op in self._operations), default=None)
+                    self._cond.wait(None if wakeup is None else wakeup - now)
+                    continue
+
+            # callbacks run outside of the lock, a slow progress handler
+            # should not block registration of new operations
+            for op in due:
+                if op.deadline <= now:
+                    self._timeout(op)
+                    continue
+
+                try:
+                    op.on_tick()
+                except Exception:
+                    logging.exception("Background progress callback failed")
+
+    def _timeout(self, op):
+        # the operation may have finished while other callbacks ran
+        with self._cond:
+            if op.state != RUNNING:
+                return
+            op.state = TIMING_OUT
+
+        state = TIMED_OUT
+        try:
+            op.on_timeout()
+        except Exception:
+            logging.exception("Background progress callback failed")
+            state = RUNNING
+        finally:
+            with self._cond:
+                op.state = state
+                self._cond.notify_all()
+
+
+watchdog = ProgressWatchdog()
@@ -32,6 +32,18 @@ def to_record(resource, data) -> RecordGroup:
     return record_group
 
 
+def count_rows(batch) -> int:
+    """ Counts the rows of a `read` batch of record groups, raw objects or dicts """
+    rows = 0
+    for item in batch or []:
+        if isinstance(item, dict) and item.get('type') != 'raw' and \
+                isinstance(item.get('data'), list) and 'metadata' in item:
+            rows += len(item['data'])
+        elif isinstance(item, dict):
+            rows += 1
+    return rows
+
+
 def validate_resource(resource):
     if not isinstance(resource, str):
         raise TypeError("`resource` must be of a type string")
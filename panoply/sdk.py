@@ -1,11 +1,14 @@
 import base64
 import json
+import logging
+import os
 import queue
 import threading
 import time
 import urllib.error
 import urllib.parse
 import urllib.request
+import weakref
 from copy import copy
 
 from . import events
@@ -15,57 +18,43 @@ MAXSIZE = 1024 * 250  # 250kib
 FLUSH_TIMEOUT = 2.0   # 2 seconds
 
 
-class SDK(events.Emitter):
+class Sender(object):
+    """
+    Buffers the written records of one queue and sends them in batches
+    to SQS from a background thread.
 
-    account = None
-    apikey = None
-    apisecret = None
-
-    # duck-typed logger object that exposes a `.log(lvl, msg)` method
-    logger = None
-
-    # internal buffer queue
-    _buffer = None
-
-    def __init__(self, apikey, apisecret):
-        super(SDK, self).__init__()
+    The thread is started lazily, and is restarted in child processes
+    after `os.fork()` with an empty buffer - records written before the
+    fork are sent by the parent.
+    """
 
+    def __init__(self, qurl, apikey, apisecret):
+        self.qurl = qurl
         self.apikey = apikey
         self.apisecret = apisecret
-
-        # decompose the api key and secret
-        # api-key: ACCOUNT/RAND1
-        # api-secret: BASE64( RAND2/UUID/AWSACCOUNT/REGION )
-        decoded = base64.b64decode(apisecret).decode().split("/")
-        rand = decoded[0]
-        awsaccount = decoded[2]
-        region = decoded[3]
-        account = apikey.split("/")[0]
-
-        # construct the queue url
-        # queue: sdk-ACCOUNT-RAND2
-        self.qurl = "https://sqs.%s.amazonaws.com/%s/sdk-%s-%s" % (
-            region,
-            awsaccount,
-            account,
-            rand
-        )
-
-        self._buffer = queue.Queue()
-        thread = threading.Thread(target=self._sendloop)
-        thread.daemon = True
-        thread.start()
-
-    def write(self, table, data):
-        # add the new data entry to the internal buffer
-        data = copy(data)
-        data["__table"] = table
-        data = json.dumps(data).encode("utf-8")
-        data = urllib.parse.quote(data)
-        self._buffer.put(data + "\n")
+        self._reset()
+        _senders.add(self)
+
+    def _reset(self):
+        self.buffer = queue.Queue()
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def put(self, sdk, key, data):
+        # the thread may not exist yet, or have died
+        if self._thread is None or not self._thread.is_alive():
+            with self._lock:
+                if self._thread is None or not self._thread.is_alive():
+                    thread = threading.Thread(target=self._sendloop)
+                    thread.daemon = True
+                    thread.start()
+                    self._thread = thread
+
+        self.buffer.put((sdk, key, data))
 
     # flush the buffer to SQS
-    def _send(self, body):
+    # `counts` is the number of records included in the body per SDK instance
+    def _send(self, body, counts):
         pack = __package_name__ + "-" + __version__
         data = [
             "Action=SendMessage",
@@ -90,27 +79,51 @@ class SDK(events.Emitter):
         print("SENDING NOW")
 
         req = urllib.request.Request(self.qurl, data, headers)
-        self.fire("send", {"req": req})
+        for sdk, count in counts.items():
+            self._fire(sdk, "send", {"req": req, "count": count})
         try:
             res = urllib.request.urlopen(req)
         except Exception as err:
-            self.fire("error", err)
+            for sdk in counts:
+                self._fire(sdk, "error", err)
             return
-        self.fire("flush", {"req": req, "res": res})
+        for sdk, count in counts.items():
+            self._fire(sdk, "flush", {"req": req, "res": res, "count": count})
+
+    @staticmethod
+    def _fire(sdk, name, data):
+        # a failing handler of one SDK instance should neither stop the
+        # sender thread nor the events of the other instances sharing it
+        try:
+            sdk.fire(name, data)
+        except Exception:
+            logging.exception("Failed to handle the SDK `%s` event", name)
 
     def _sendloop(self):
-        buf = self._buffer
-        body = ""
+        buf = self.buffer
+        # pending records by key, unkeyed records get a running number
+        pending = {}
+        length = 0
+        counts = {}
+        seq = 0
         lastsend = time.time()
         while True:
             data = None
             try:
-                data = buf.get(True, FLUSH_TIMEOUT)  # blocking
-                body += data + "\n"
+                sdk, key, data = buf.get(True, FLUSH_TIMEOUT)  # blocking
+                if key is None:
+                    key = seq
+                    seq += 1
+
+                previous = pending.get(key)
+                if previous is not None:
+                    length -= len(previous) + 1
+                pending[key] = data
+                length += len(data) + 1
+                counts[sdk] = counts.get(sdk, 0) + 1
             except queue.Empty:
                 pass
 
-            length = len(body)
             elapsed = time.time() - lastsend
 
             if length == 0:
@@ -118,8 +131,108 @@ class SDK(events.Emitter):
                 lastsend = time.time()
             elif length > MAXSIZE or elapsed > FLUSH_TIMEOUT:
                 lastsend = time.time()
-                self._send(body)
-                body = ""
+                body = "".join(line + "\n" for line in pending.values())
+                self._send(body, counts)
+                pending = {}
+                length = 0
+                counts = {}
 
             if data:
                 buf.task_done()
+
+
+# all the senders, to be reset in forked child processes
+_senders = weakref.WeakSet()
+
+# process-wide senders shared by SDK instances, by queue and credentials
+_shared_senders = {}
+_shared_senders_lock = threading.Lock()
+
+
+def _after_fork():
+    global _shared_senders_lock
+    _shared_senders_lock = threading.Lock()
+    for sender in list(_senders):
+        sender._reset()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_after_fork)
+
+
+class SDK(events.Emitter):
+
+    account = None
+    apikey = None
+    apisecret = None
+
+    # duck-typed logger object that exposes a `.log(lvl, msg)` method
+    logger = None
+
+    # the sender of the written records
+    _sender = None
+
+    # table -> key field(s), records with the same key within a single
+    # batch are compacted so only the latest version is sent
+    keys = None
+
+    def __init__(self, apikey, apisecret, keys=None, shared=False):
+        super(SDK, self).__init__()
+
+        self.apikey = apikey
+        self.apisecret = apisecret
+        self.keys = dict(keys or {})
+
+        # decompose the api key and secret
+        # api-key: ACCOUNT/RAND1
+        # api-secret: BASE64( RAND2/UUID/AWSACCOUNT/REGION )
+        decoded = base64.b64decode(apisecret).decode().split("/")
+        rand = decoded[0]
+        awsaccount = decoded[2]
+        region = decoded[3]
+        account = apikey.split("/")[0]
+
+        # construct the queue url
+        # queue: sdk-ACCOUNT-RAND2
+        self.qurl = "https://sqs.%s.amazonaws.com/%s/sdk-%s-%s" % (
+            region,
+            awsaccount,
+            account,
+            rand
+        )
+
+        # with `shared`, all the SDK instances of the same queue in the
+        # process use a single sender thread and buffer
+        if shared:
+            key = (self.qurl, apikey, apisecret)
+            with _shared_senders_lock:
+                if key not in _shared_senders:
+                    _shared_senders[key] = Sender(*key)
+                self._sender = _shared_senders[key]
+        else:
+            self._sender = Sender(self.qurl, apikey, apisecret)
+
+    @property
+    def _buffer(self):
+        return self._sender.buffer
+
+    def write(self, table, data, key=None):
+        # `key` is a field name, or a tuple of field names, identifying
+        # the record. only the last write per key is sent in each batch
+        key = key or self.keys.get(table)
+        if key is not None:
+            fields = (key,) if isinstance(key, str) else key
+            missing = [field for field in fields if field not in data]
+            if missing:
+                raise ValueError(
+                    "Record for table `%s` is missing the key field(s) %s"
+                    % (table, ", ".join("`%s`" % f for f in missing))
+                )
+            key = (table, json.dumps([data[field] for field in fields]))
+
+        # add the new data entry to the internal buffer
+        data = copy(data)
+        data["__table"] = table
+        data = json.dumps(data).encode("utf-8")
+        data = urllib.parse.quote(data)
+        self._sender.put(self, key, data + "\n")
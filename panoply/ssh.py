@@ -1,14 +1,41 @@
 """
     Module for storing SSH related stuff
 """
+import base64
+import binascii
+import hashlib
 import logging
-from typing import Dict
-from paramiko import RSAKey, Ed25519Key, SSHException
+import struct
+import threading
+from typing import Dict, List, Optional, Tuple
+from paramiko import RSAKey, Ed25519Key, ECDSAKey, PKey, SSHException
 from sshtunnel import SSHTunnelForwarder
 from io import StringIO
 from sys import stdout
 
 from .errors import IncorrectParamError
+from .profiling import profiler
+
+# seconds an unused pooled tunnel is kept open before it is shut down
+IDLE_TIMEOUT = 60.0
+
+PEM_KEY_TYPES = {
+    "RSA": RSAKey,
+    "EC": ECDSAKey,
+}
+
+OPENSSH_KEY_TYPES = {
+    b"ssh-rsa": RSAKey,
+    b"ssh-ed25519": Ed25519Key,
+    b"ecdsa-sha2-nistp256": ECDSAKey,
+    b"ecdsa-sha2-nistp384": ECDSAKey,
+    b"ecdsa-sha2-nistp521": ECDSAKey,
+}
+
+OPENSSH_MAGIC = b"openssh-key-v1\x00"
+
+# parsed private keys, by a hash of the key material and password
+_pkeys = {}
 
 
 def get_stdout_only_logger():
@@ -18,6 +45,197 @@ def get_stdout_only_logger():
     return logger
 
 
+def detect_key_class(private_key: str) -> Optional[type]:
+    """
+    Detect the paramiko key class from the PEM / OpenSSH header
+    without parsing (and decrypting) the whole key.
+    Returns None when the type can't be detected.
+    """
+    private_key = private_key.strip()
+    if not private_key.startswith("-----BEGIN "):
+        return None
+
+    label = private_key[len("-----BEGIN "):].split("-----", 1)[0]
+    label = label.replace("PRIVATE KEY", "").strip()
+    if label in PEM_KEY_TYPES:
+        return PEM_KEY_TYPES[label]
+    if label != "OPENSSH":
+        return None
+
+    # openssh-key-v1 keeps the public key unencrypted:
+    # magic, ciphername, kdfname, kdfoptions, number of keys, public key
+    body = private_key.split("-----")[2]
+    try:
+        blob = base64.b64decode("".join(body.split()))
+    except (binascii.Error, ValueError):
+        return None
+    if not blob.startswith(OPENSSH_MAGIC):
+        return None
+
+    try:
+        offset = len(OPENSSH_MAGIC)
+        for _ in range(3):
+            length, = struct.unpack(">I", blob[offset:offset + 4])
+            offset += 4 + length
+        offset += 4  # number of keys
+        offset += 4  # public key length
+        length, = struct.unpack(">I", blob[offset:offset + 4])
+        key_type = blob[offset + 4:offset + 4 + length]
+    except struct.error:
+        return None
+
+    return OPENSSH_KEY_TYPES.get(key_type)
+
+
+def load_private_key(private_key: str, password: str = None) -> PKey:
+    """
+    Parse the private key, trying the detected key type first
+    and then the rest of the supported ones.
+    Parsed keys are cached for the lifetime of the process.
+    """
+    digest = hashlib.sha256(
+        f"{password or ''}\x00{private_key}".encode()
+    ).hexdigest()
+    if digest in _pkeys:
+        return _pkeys[digest]
+
+    key_classes = [RSAKey, Ed25519Key, ECDSAKey]
+    detected = detect_key_class(private_key)
+    if detected:
+        key_classes.remove(detected)
+        key_classes.insert(0, detected)
+
+    error = None
+    for key_class in key_classes:
+        try:
+            pkey = key_class.from_private_key(StringIO(private_key),
+                                              password=password)
+            break
+        except SSHException as err:
+            error = error or err
+    else:
+        raise error
+
+    _pkeys[digest] = pkey
+    return pkey
+
+
+class TunnelPool:
+    """
+        Process-wide registry of started ssh tunnels.
+
+        Tunnels are keyed by (ssh host, ssh port, ssh user, remote binds)
+        and reference counted, so that several connections to the same
+        resource share a single ssh session instead of paying
+        the full handshake each time.
+
+        On every `acquire` the transport of an existing tunnel is
+        checked and, if it went down, the tunnel is re-created.
+        When the last reference is released, the tunnel is kept open
+        for `idle_timeout` seconds and then stopped.
+
+        Tunnels are started under a per-key lock, so handshakes with
+        different servers run concurrently.
+    """
+    def __init__(self, idle_timeout: float = IDLE_TIMEOUT):
+        self.idle_timeout = idle_timeout
+        self._lock = threading.Lock()
+        self._servers = {}
+        self._refs = {}
+        self._timers = {}
+        self._key_locks = {}
+
+    def acquire(self, key, factory):
+        """Return a started server for `key`, creating it with `factory`"""
+        with self._lock:
+            timer = self._timers.pop(key, None)
+            if timer:
+                timer.cancel()
+
+            # the reference keeps the server of `key` from being stopped
+            self._refs[key] = self._refs.get(key, 0) + 1
+            key_lock = self._key_locks.setdefault(key, threading.Lock())
+
+        try:
+            with key_lock:
+                server = self._servers.get(key)
+                if server is not None and not server.is_active:
+                    # the transport dropped - reconnect
+                    self._stop(server)
+                    server = None
+
+                if server is None:
+                    server = factory()
+                    with self._lock:
+                        self._servers[key] = server
+
+                return server
+        except Exception:
+            self.release(key)
+            raise
+
+    def release(self, key):
+        """Drop a reference, scheduling idle shutdown for the last one"""
+        with self._lock:
+            refs = self._refs.get(key, 0) - 1
+            if refs > 0:
+                self._refs[key] = refs
+                return
+
+            self._refs.pop(key, None)
+            self._key_locks.pop(key, None)
+            if key not in self._servers:
+                return
+
+            server = None
+            if self.idle_timeout <= 0:
+                server = self._servers.pop(key)
+            else:
+                timer = threading.Timer(self.idle_timeout, self._expire,
+                                        args=(key,))
+                timer.daemon = True
+                self._timers[key] = timer
+                timer.start()
+
+        if server is not None:
+            self._stop(server)
+
+    def close(self):
+        """Stop all the pooled tunnels"""
+        with self._lock:
+            for timer in self._timers.values():
+                timer.cancel()
+            servers = list(self._servers.values())
+
+            self._timers = {}
+            self._servers = {}
+            self._refs = {}
+            self._key_locks = {}
+
+        for server in servers:
+            self._stop(server)
+
+    def _expire(self, key):
+        with self._lock:
+            if self._refs.get(key) or key not in self._timers:
+                return
+
+            self._timers.pop(key)
+            server = self._servers.pop(key)
+
+        self._stop(server)
+
+    @staticmethod
+    def _stop(server):
+        try:
+            server.stop()
+        except Exception:
+            logging.exception("Failed to stop ssh tunnel")
+
+
+_pool = TunnelPool()
+
+
 class SSHTunnel:
     """
         General SSH tunnel class-component
@@ -75,6 +293,19 @@ class SSHTunnel:
                 if False -> we will use python SSHTunnel logic.
                 if True -> we will use platform SSH.
 
+            pooled (bool, False by default):
+
+                if True -> the tunnel is taken from the process-wide
+                `TunnelPool`, and reused by other pooled tunnels
+                with the same ssh server, user and remote address.
+                Close it with `tunnel.close()` rather than `server.stop()`.
+
+            endpoints (list of (host, port) tuples, empty by default):
+
+                Additional remote resources (e.g. replicas behind the same
+                bastion) forwarded over the same ssh transport.
+                Each endpoint gets its own local port, see `local_port`.
+
         How to Use:
 
             1) tunnel = SSHTunnel('127.0.0.1', 27017, {...params}, False)
@@ -85,13 +316,32 @@ class SSHTunnel:
             2) with SSHTunnel('127.0.0.1', 27017, {..params}, False) as server:
                    ... your code here - tunnel will be closed automatically
 
+            3) tunnel = SSHTunnel('127.0.0.1', 27017, {...params}, False,
+                                  pooled=True)
+               server = tunnel.server
+               ... your code
+               tunnel.close() - releases the shared tunnel
+
+            4) tunnel = SSHTunnel('10.0.0.1', 5432, {...params}, False,
+                                  endpoints=[('10.0.0.2', 5432)])
+               primary_port = tunnel.local_port('10.0.0.1', 5432)
+               replica_port = tunnel.local_port('10.0.0.2', 5432)
+               ... your code
+               tunnel.close()
+
     """
     def __init__(self, host: str, port: int,
-                 ssh_tunnel: Dict, platform_ssh: bool = True):
+                 ssh_tunnel: Dict, platform_ssh: bool = True,
+                 pooled: bool = False,
+                 endpoints: List[Tuple[str, int]] = None):
         self.host = host
         self.port = port
         self.tunnel = ssh_tunnel
-        self._server = self._get_server(platform_ssh)
+        self.endpoints = endpoints or []
+        self.pooled = pooled
+        self._server = None
+        if not platform_ssh:
+            self._server = self._get_server()
 
     @property
     def server(self):
@@ -110,6 +360,44 @@ class SSHTunnel:
 
         self._port = value
 
+    @property
+    def endpoints(self):
+        return self._endpoints
+
+    @endpoints.setter
+    def endpoints(self, value):
+        endpoints = []
+        for endpoint in value:
+            host, port = endpoint
+            if not isinstance(port, int):
+                raise IncorrectParamError("Port should be instance of `int`")
+            if port < 0 or port > 65535:
+                raise IncorrectParamError("Port should be in range [0: 65535]")
+            endpoints.append((host, port))
+
+        self._endpoints = endpoints
+
+    @property
+    def remote_binds(self):
+        return [(self.host, self.port)] + [
+            endpoint for endpoint in self.endpoints
+            if endpoint != (self.host, self.port)
+        ]
+
+    def local_port(self, host: str = None, port: int = None) -> int:
+        """
+        Local port forwarded to the remote `host` and `port`,
+        by default the main resource of the tunnel.
+        """
+        if not self._server:
+            raise IncorrectParamError("SSH tunnel is not started")
+
+        remote = (host or self.host, port or self.port)
+        if remote not in self.remote_binds:
+            raise IncorrectParamError(f"{remote} is not forwarded by the tunnel")
+
+        return self._server.tunnel_bindings[remote][1]
+
     @property
     def tunnel(self):
         return self._tunnel
@@ -136,36 +424,57 @@ class SSHTunnel:
         value["port"] = int(value.get("port", 22))
         self._tunnel = value
 
-    def _get_server(self, platform_ssh: bool):
+    @property
+    def pool_key(self):
+        return (
+            self.tunnel["host"], self.tunnel["port"],
+            self.tunnel["username"], tuple(self.remote_binds)
+        )
+
+    def _get_server(self):
         """Method for getting and starting ssh server."""
-        if platform_ssh:
-            return None
+        if self.pooled:
+            return _pool.acquire(self.pool_key, self._start_server)
 
-        try:
-            pkey = RSAKey.from_private_key(StringIO(self.tunnel["privateKey"]),
-                                           password=self.tunnel.get("password"))
-        except SSHException:
-            pkey = Ed25519Key.from_private_key(StringIO(self.tunnel["privateKey"]),
-                                               password=self.tunnel.get("password"))
+        return self._start_server()
+
+    def _start_server(self):
+        return profiler.call("SSHTunnel.start", self._create_server)
+
+    def _create_server(self):
+        pkey = load_private_key(self.tunnel["privateKey"],
+                                self.tunnel.get("password"))
 
         server = SSHTunnelForwarder(
             ssh_address_or_host=(self.tunnel["host"], self.tunnel["port"]),
             ssh_username=self.tunnel["username"],
             ssh_password=self.tunnel.get("password"),
             ssh_pkey=pkey,
-            remote_bind_address=(self.host, self.port),
+            remote_bind_addresses=self.remote_binds,
             logger=get_stdout_only_logger()
         )
-        server.start()
+        with profiler.network():
+            server.start()
 
         return server
 
+    def close(self):
+        """Stop the tunnel, or release it back to the pool"""
+        if not self._server:
+            return
+
+        if self.pooled:
+            _pool.release(self.pool_key)
+        else:
+            self._server.stop()
+
+        self._server = None
+
     def __enter__(self):
         return self._server
 
     def __exit__(self, exc_type, exc_val, exc_tb):
-        if self._server:
-            self._server.stop()
+        self.close()
 
     def __str__(self):
         return "SSH tunnel to {}, for user {}".format(
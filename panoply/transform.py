@@ -0,0 +1,138 @@
+"""
+    Process-pool stage for CPU-heavy parsing in Data Sources
+"""
+import logging
+import os
+import pickle
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from itertools import islice
+
+
+def _transform_chunk(func, chunk):
+    return [func(page) for page in chunk]
+
+
+def _chunked(pages, chunksize):
+    pages = iter(pages)
+    while True:
+        chunk = list(islice(pages, chunksize))
+        if not chunk:
+            return
+        yield chunk
+
+
+class TransformPool(object):
+    """
+    Runs `func` over raw pages (e.g. API responses) in worker processes,
+    yielding the results (e.g. record groups) in the order of the pages.
+
+    Pages are sent to the workers in chunks of `chunksize`, and at most
+    `max_pending` chunks are in flight, so a large stream of pages isn't
+    read into memory at once. `func` should be a picklable (module level)
+    function; otherwise, with a single process, or if the pool can't be
+    started or breaks, the pages are transformed in-process.
+
+    How to Use:
+
+        pool = TransformPool(parse_page, chunksize=4)
+        for record_group in pool.map(pages):
+            ...
+        pool.close()
+    """
+
+    def __init__(self, func, processes=None, chunksize=1, max_pending=None):
+        self.func = func
+        self.processes = processes or os.cpu_count() or 1
+        self.chunksize = chunksize
+        self.max_pending = max_pending or self.processes * 2
+        self.inline = self.processes <= 1 or not self._picklable(func)
+        self._executor = None
+
+    def map(self, pages):
+        """ Transform the pages, yielding the results in order """
+        chunks = _chunked(pages, self.chunksize)
+        pending = deque()
+        for chunk in chunks:
+            executor = self._get_executor()
+            if executor is None:
+                break
+
+            try:
+                future = executor.submit(_transform_chunk, self.func, chunk)
+            except BrokenProcessPool:
+                self._fallback()
+                break
+            pending.append((chunk, future))
+
+            if len(pending) >= self.max_pending:
+                yield from self._result(*pending.popleft())
+        else:
+            chunk = None
+
+        while pending:
+            yield from self._result(*pending.popleft())
+
+        # in-process fallback for the rest of the pages
+        if chunk is not None:
+            yield from _transform_chunk(self.func, chunk)
+        for chunk in chunks:
+            yield from _transform_chunk(self.func, chunk)
+
+    def close(self):
+        if self._executor is not None:
+            self._executor.shutdown()
+            self._executor = None
+
+    def _result(self, chunk, future):
+        # after a fallback, only the chunks whose workers didn't complete
+        # are transformed again in-process
+        if self.inline and not self._succeeded(future):
+            return _transform_chunk(self.func, chunk)
+
+        try:
+            return future.result()
+        except BrokenProcessPool:
+            self._fallback()
+            return _transform_chunk(self.func, chunk)
+
+    def _get_executor(self):
+        if self.inline:
+            return None
+
+        if self._executor is None:
+            try:
+                self._executor = ProcessPoolExecutor(self.processes)
+            except (OSError, NotImplementedError, ImportError):
+                logging.exception("Failed to start the transform processes")
+                self.inline = True
+                return None
+
+        return self._executor
+
+    def _fallback(self):
+        logging.error("Transform processes are broken, "
+                      "falling back to in-process execution")
+        self.inline = True
+        self._executor.shutdown(wait=False)
+        self._executor = None
+
+    @staticmethod
+    def _succeeded(future):
+        return future.done() and not future.cancelled() and \
+            future.exception() is None
+
+    @staticmethod
+    def _picklable(func):
+        try:
+            pickle.dumps(func)
+        except Exception:
+            return False
+        return True
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
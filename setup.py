@@ -30,6 +30,11 @@ setup(
             "coverage==4.5.1",
         ],
     },
+    entry_points={
+        "console_scripts": [
+            "panoply-load=panoply.load:main",
+        ],
+    },
     url="https://github.com/panoplyio/panoply-python-sdk",
     author="Panoply.io",
     author_email="support@panoply.io",
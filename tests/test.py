@@ -1,7 +1,17 @@
-from unittest import TestCase
-from unittest.mock import patch
+from unittest import TestCase, skipUnless
+from unittest.mock import MagicMock, patch
+from concurrent.futures import Future
+from concurrent.futures.process import BrokenProcessPool
+import paramiko
 import panoply
 import base64
+import io
+import json
+import os
+import threading
+import time
+import tracemalloc
+import urllib.parse
 
 TEST_KEY = "test/key"
 TEST_SECRET = b"rand2/uuid/awsaccount/region"
@@ -21,6 +31,96 @@ class TestPanoplyPythonSDK(TestCase):
 
         self.assertEqual(sdk._buffer.qsize(), 2)
 
+    def test_keyed_write_without_key_field(self):
+        sdk = panoply.SDK(TEST_KEY, base64.b64encode(TEST_SECRET), keys={"status": ("id", "region")})
+
+        with self.assertRaisesRegex(ValueError, "table `status` is missing the key field\\(s\\) `region`"):
+            sdk.write("status", {"id": 1})
+        self.assertEqual(sdk._buffer.qsize(), 0)
+
+    def test_shared_sender(self):
+        first = panoply.SDK(TEST_KEY, base64.b64encode(TEST_SECRET), shared=True)
+        second = panoply.SDK(TEST_KEY, base64.b64encode(TEST_SECRET), shared=True)
+        other = panoply.SDK(TEST_KEY, base64.b64encode(TEST_SECRET))
+
+        self.assertIs(first._sender, second._sender)
+        self.assertIsNot(first._sender, other._sender)
+
+    @skipUnless(hasattr(os, "fork"), "requires os.fork")
+    def test_sender_is_reset_after_fork(self):
+        sdk = panoply.SDK(TEST_KEY, base64.b64encode(TEST_SECRET))
+        sdk._buffer.put((sdk, None, "pending"))
+
+        pid = os.fork()
+        if pid == 0:
+            empty = sdk._buffer.qsize() == 0 and sdk._sender._thread is None
+            os._exit(0 if empty else 1)
+
+        _, status = os.waitpid(pid, 0)
+        self.assertEqual(os.WEXITSTATUS(status), 0)
+        self.assertEqual(sdk._buffer.qsize(), 1)
+
+    @patch("panoply.sdk.FLUSH_TIMEOUT", 0.05)
+    def test_keyed_write_is_compacted(self):
+        sent = threading.Event()
+        bodies = []
+
+        def send(body, counts):
+            bodies.append(body)
+            sent.set()
+
+        with patch.object(panoply.sdk.Sender, "_send", side_effect=send):
+            sdk = panoply.SDK(TEST_KEY, base64.b64encode(TEST_SECRET), keys={"status": "id"})
+            for i in range(3):
+                sdk.write("status", {"id": 1, "value": i})
+                sdk.write("status", {"id": 2, "value": i})
+                sdk.write("counters", {"id": 1, "value": i}, key="id")
+                sdk.write("events", {"id": 1, "value": i})
+            self.assertTrue(sent.wait(1))
+
+        records = [json.loads(urllib.parse.unquote(line)) for line in bodies[0].split()]
+        self.assertEqual(records, [
+            {"id": 1, "value": 2, "__table": "status"},
+            {"id": 2, "value": 2, "__table": "status"},
+            {"id": 1, "value": 2, "__table": "counters"},
+            {"id": 1, "value": 0, "__table": "events"},
+            {"id": 1, "value": 1, "__table": "events"},
+            {"id": 1, "value": 2, "__table": "events"},
+        ])
+
+    @patch("panoply.sdk.FLUSH_TIMEOUT", 0.05)
+    def test_failing_handler_does_not_stop_shared_sender(self):
+        secret = base64.b64encode(TEST_SECRET).decode()
+        failing = panoply.SDK(TEST_KEY, secret, shared=True)
+        other = panoply.SDK(TEST_KEY, secret, shared=True)
+        flushed = []
+        failing.on("flush", lambda data: 1 / 0)
+        other.on("flush", flushed.append)
+
+        def wait_for_flush(count):
+            deadline = time.time() + 1
+            while len(flushed) < count and time.time() < deadline:
+                time.sleep(0.01)
+
+        with patch("urllib.request.urlopen"), patch("panoply.sdk.logging"):
+            for batch in range(1, 3):
+                failing.write("table", {"data": 1})
+                other.write("table", {"data": 2})
+                wait_for_flush(batch)
+
+            self.assertEqual([data["count"] for data in flushed], [1, 1])
+            self.assertTrue(other._sender._thread.is_alive())
+
+            # a dead sender thread is restarted on the next write
+            other._sender._thread = threading.Thread(target=lambda: None)
+            other._sender._thread.start()
+            other._sender._thread.join()
+            other.write("table", {"data": 3})
+            self.assertTrue(other._sender._thread.is_alive())
+            wait_for_flush(3)
+
+        self.assertEqual(len(flushed), 3)
+
 
 class TestSSHTunnel(TestCase):
 
@@ -78,3 +178,355 @@ class TestSSHTunnel(TestCase):
 
         with panoply.SSHTunnel("127.0.0.1", 22, self.MOCKED_TUNNEL_OBJECT, False) as tunnel:  # noqa
             self.assertEqual(tunnel.server, self.MOCKED_TUNNEL_OBJECT)
+
+    @patch("paramiko.RSAKey.from_private_key")
+    @patch("panoply.ssh.SSHTunnelForwarder")
+    def test_pooled_tunnel_is_shared(self, SSHTunnelForwarder, from_private_key):
+        pool = panoply.ssh.TunnelPool(idle_timeout=0)
+        with patch("panoply.ssh._pool", pool):
+            first = panoply.SSHTunnel("127.0.0.1", 5432, self.MOCKED_TUNNEL_OBJECT, False, pooled=True)  # noqa
+            second = panoply.SSHTunnel("127.0.0.1", 5432, self.MOCKED_TUNNEL_OBJECT, False, pooled=True)  # noqa
+
+            self.assertIs(first.server, second.server)
+            self.assertEqual(SSHTunnelForwarder.call_count, 1)
+
+            server = first.server
+            first.close()
+            server.stop.assert_not_called()
+            second.close()
+            server.stop.assert_called_once()
+
+    def test_pool_starts_different_keys_concurrently(self):
+        pool = panoply.ssh.TunnelPool(idle_timeout=0)
+
+        def factory():
+            time.sleep(0.3)
+            return MagicMock()
+
+        started = time.time()
+        threads = [threading.Thread(target=pool.acquire, args=(key, factory)) for key in ("first", "second")]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertLess(time.time() - started, 0.55)
+        self.assertEqual(set(pool._servers), {"first", "second"})
+        pool.close()
+
+    def test_load_private_key(self):
+        from cryptography.hazmat.primitives import serialization
+        from cryptography.hazmat.primitives.asymmetric import ec, ed25519
+
+        test_cases = [
+            (ed25519.Ed25519PrivateKey.generate(), serialization.PrivateFormat.OpenSSH, paramiko.Ed25519Key),
+            (ec.generate_private_key(ec.SECP256R1()), serialization.PrivateFormat.OpenSSH, paramiko.ECDSAKey),
+            (ec.generate_private_key(ec.SECP256R1()), serialization.PrivateFormat.TraditionalOpenSSL,
+             paramiko.ECDSAKey),
+        ]
+
+        for key, key_format, expected in test_cases:
+            private_key = key.private_bytes(serialization.Encoding.PEM, key_format,
+                                            serialization.NoEncryption()).decode()
+            self.assertIs(panoply.ssh.detect_key_class(private_key), expected)
+
+            pkey = panoply.ssh.load_private_key(private_key)
+            self.assertIsInstance(pkey, expected)
+            self.assertIs(panoply.ssh.load_private_key(private_key), pkey)
+
+    @patch("paramiko.RSAKey.from_private_key")
+    @patch("panoply.ssh.SSHTunnelForwarder")
+    def test_tunnel_with_endpoints(self, SSHTunnelForwarder, from_private_key):
+        SSHTunnelForwarder.return_value.tunnel_bindings = {
+            ("10.0.0.1", 5432): ("127.0.0.1", 40001),
+            ("10.0.0.2", 5432): ("127.0.0.1", 40002),
+        }
+
+        tunnel = panoply.SSHTunnel("10.0.0.1", 5432, self.MOCKED_TUNNEL_OBJECT, False,
+                                   endpoints=[("10.0.0.2", 5432)])
+
+        self.assertEqual(SSHTunnelForwarder.call_count, 1)
+        self.assertEqual(SSHTunnelForwarder.call_args[1]["remote_bind_addresses"],
+                         [("10.0.0.1", 5432), ("10.0.0.2", 5432)])
+        self.assertEqual(tunnel.local_port(), 40001)
+        self.assertEqual(tunnel.local_port("10.0.0.2", 5432), 40002)
+        with self.assertRaises(panoply.errors.IncorrectParamError):
+            tunnel.local_port("10.0.0.3", 5432)
+
+
+class TestBackgroundProgress(TestCase):
+
+    class MockedDataSource(panoply.DataSource):
+        def __init__(self):
+            super().__init__({}, {"logger": lambda msgs: None})
+            self.cancelled = threading.Event()
+
+        def read(self, batch_size=None):
+            pass
+
+        def cancel(self):
+            self.cancelled.set()
+
+        @panoply.background_progress("waiting", waiting_interval=0.01)
+        def wait(self, seconds):
+            time.sleep(seconds)
+            return seconds
+
+        @panoply.background_progress("waiting", waiting_interval=0.01, timeout=0.05)
+        def wait_past_timeout(self):
+            time.sleep(0.2)
+            return "done"
+
+        @panoply.background_progress("waiting", waiting_interval=0.01, timeout=0.05, cancel="cancel")
+        def wait_for_cancel(self):
+            self.cancelled.wait(1)
+
+        @panoply.background_progress("waiting", waiting_interval=0.01, timeout=0.03, cancel="cancel")
+        def finish_at_timeout(self):
+            time.sleep(0.03)
+            return "done"
+
+    def test_emits_progress_in_background(self):
+        source = self.MockedDataSource()
+        progress = []
+        source.on("progress", progress.append)
+
+        self.assertEqual(source.wait(0.1), 0.1)
+        self.assertGreater(len(progress), 2)
+
+    def test_cancels_on_timeout(self):
+        source = self.MockedDataSource()
+
+        with self.assertRaisesRegex(Exception, "Max waiting time exceeded"):
+            source.wait_for_cancel()
+        self.assertTrue(source.cancelled.is_set())
+
+    def test_returns_result_on_timeout_without_cancel(self):
+        source = self.MockedDataSource()
+        progress = []
+        source.on("progress", progress.append)
+
+        self.assertEqual(source.wait_past_timeout(), "done")
+        # progress stops once the timeout is exceeded
+        self.assertLess(len(progress), 10)
+
+    def test_no_cancel_after_the_operation_finished(self):
+        # a slow progress handler of another operation delays the timeout
+        slow = self.MockedDataSource()
+        slow.on("progress", lambda data: time.sleep(0.02))
+        waiting = threading.Thread(target=slow.wait, args=(0.5,))
+        waiting.start()
+
+        for _ in range(20):
+            source = self.MockedDataSource()
+            try:
+                result = source.finish_at_timeout()
+            except Exception as err:
+                self.assertEqual(str(err), "Max waiting time exceeded")
+                self.assertTrue(source.cancelled.is_set())
+            else:
+                self.assertEqual(result, "done")
+                self.assertFalse(source.cancelled.wait(0.05))
+        waiting.join()
+
+
+class TestEmitter(TestCase):
+
+    def test_async_dispatch_coalesces_progress(self):
+        emitter = panoply.events.Emitter().dispatch_async()
+        release = threading.Event()
+        progress, states = [], []
+        emitter.on("block", lambda data: release.wait(1))
+        emitter.on("progress", progress.append)
+        emitter.on("source-state", states.append)
+
+        emitter.fire("block", None)
+        for i in range(5):
+            emitter.fire("progress", i)
+            emitter.fire("source-state", i)
+        release.set()
+        emitter.join_events()
+
+        self.assertEqual(progress, [4])
+        self.assertEqual(states, [0, 1, 2, 3, 4])
+
+    def test_async_emitters_share_a_thread(self):
+        panoply.events.Emitter().dispatch_async().fire("start", None).join_events()
+        threads = threading.active_count()
+
+        handled = []
+        for i in range(50):
+            emitter = panoply.events.Emitter().dispatch_async().dispatch_async()
+            emitter.on("progress", handled.append)
+            emitter.fire("progress", i).join_events()
+
+        self.assertEqual(handled, list(range(50)))
+        self.assertEqual(threading.active_count(), threads)
+
+
+class TestRawStream(TestCase):
+
+    PAYLOAD = bytes(range(256)) * 3 + b"tail"
+
+    class MockedDataSource(panoply.DataSource):
+        def read(self, batch_size=None):
+            pass
+
+    def test_raw_stream(self):
+        source = self.MockedDataSource({})
+        test_cases = [
+            (lambda: self.PAYLOAD, False),
+            (lambda: io.BytesIO(self.PAYLOAD), False),
+            (lambda: (self.PAYLOAD[i:i + 100] for i in range(0, len(self.PAYLOAD), 100)), False),
+            (lambda: (self.PAYLOAD[i:i + 100] for i in range(0, len(self.PAYLOAD), 100)), True),
+        ]
+
+        for make_stream, spool in test_cases:
+            chunks = list(source.raw_stream("file", make_stream(), {"name": "export"}, chunk_size=96, spool=spool))
+
+            self.assertEqual(len(chunks), 9)
+            self.assertEqual(b"".join(base64.b64decode(chunk["raw"]) for chunk in chunks), self.PAYLOAD)
+            self.assertEqual(base64.b64decode(b"".join(chunk["raw"] for chunk in chunks)), self.PAYLOAD)
+            self.assertEqual([chunk["metadata"]["chunk"] for chunk in chunks], list(range(9)))
+            self.assertEqual([chunk["metadata"]["last"] for chunk in chunks], [False] * 8 + [True])
+            self.assertEqual(chunks[0]["metadata"]["name"], "export")
+
+    def test_raw_stream_with_incorrect_chunk_size(self):
+        source = self.MockedDataSource({})
+
+        with self.assertRaises(ValueError):
+            source.raw_stream("file", b"", {}, chunk_size=100)
+
+
+class TestTransformPool(TestCase):
+
+    PAGES = [json.dumps([{"id": i}, {"id": i + 1}]) for i in range(20)]
+
+    def test_map_in_processes(self):
+        with panoply.TransformPool(json.loads, processes=2, chunksize=3) as pool:
+            self.assertFalse(pool.inline)
+            self.assertEqual(list(pool.map(iter(self.PAGES))), [json.loads(page) for page in self.PAGES])
+
+    def test_completed_chunks_are_kept_after_fallback(self):
+        pool = panoply.TransformPool(json.loads, processes=2)
+        pool.inline = True
+        done, broken = Future(), Future()
+        done.set_result(["from worker"])
+        broken.set_exception(BrokenProcessPool())
+
+        self.assertEqual(pool._result(["[1]"], done), ["from worker"])
+        self.assertEqual(pool._result(["[1]"], broken), [[1]])
+        self.assertEqual(pool._result(["[1]"], Future()), [[1]])
+
+    def test_map_falls_back_to_in_process(self):
+        with panoply.TransformPool(lambda page: json.loads(page), processes=2) as pool:
+            self.assertTrue(pool.inline)
+            self.assertEqual(list(pool.map(self.PAGES)), [json.loads(page) for page in self.PAGES])
+
+
+class TestProfiler(TestCase):
+
+    class MockedDataSource(panoply.DataSource):
+        @panoply.errors.wrap_errors(panoply.errors.Phase.COLLECT)
+        def read(self, batch_size=None):
+            with panoply.profiler.network():
+                time.sleep(0.01)
+            return [panoply.to_record("customers", [{"id": 1}, {"id": 2}, {"id": 3}]),
+                    self.raw("file", b"abc", {})]
+
+        @panoply.errors.wrap_errors(panoply.errors.Phase.COLLECT)
+        def read_stream(self, batch_size=None):
+            return self.raw_stream("file", b"abcdefg", {}, chunk_size=3)
+
+    def test_profiles_wrapped_methods(self):
+        profiler = panoply.profiler.reset()
+        calls = []
+        source = self.MockedDataSource({})
+
+        with patch.object(profiler, "_events", {"profile": (calls.append,)}):
+            source.read()
+            try:
+                profiler.enable(requests=False)
+                source.read()
+            finally:
+                profiler.disable()
+
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(calls[0]["rows"], 4)
+        self.assertEqual(calls[0]["bytes"], 3)
+        self.assertGreaterEqual(calls[0]["network"], 0.01)
+        self.assertAlmostEqual(calls[0]["python"], calls[0]["wall"] - calls[0]["network"])
+
+        stats = profiler.stats["TestProfiler.MockedDataSource.read"]
+        self.assertEqual(stats.calls, 1)
+        self.assertIn("TestProfiler.MockedDataSource.read", profiler.report())
+
+    def test_profiles_returned_generators(self):
+        profiler = panoply.profiler.reset()
+        source = self.MockedDataSource({})
+
+        try:
+            profiler.enable(requests=False)
+            chunks = list(source.read_stream())
+        finally:
+            profiler.disable()
+
+        self.assertEqual(len(chunks), 3)
+        stats = profiler.stats["TestProfiler.MockedDataSource.read_stream (iterated)"]
+        self.assertEqual(stats.rows, 3)
+        self.assertEqual(stats.bytes, 7)
+
+    def test_disable_stops_cprofile_and_tracemalloc(self):
+        profiler = panoply.profiling.Profiler()
+
+        profiler.enable(cprofile=True, memory=True, requests=False)
+        self.assertTrue(tracemalloc.is_tracing())
+        profiler.disable()
+        self.assertFalse(tracemalloc.is_tracing())
+
+        profiler.enable(requests=False)
+        with profiler.measure("call"):
+            pass
+        profiler.disable()
+        self.assertIsNone(profiler._cprofile)
+
+
+class TestBatching(TestCase):
+
+    class MockedDataSource(panoply.DataSource):
+        def __init__(self, rows):
+            super().__init__({})
+            self.rows = rows
+            self.batch_sizes = []
+
+        def read(self, batch_size=None):
+            if not self.rows:
+                return None
+            self.batch_sizes.append(batch_size)
+            data, self.rows = self.rows[:batch_size], self.rows[batch_size:]
+            return [panoply.to_record("customers", data)]
+
+    def test_tuner(self):
+        tuner = panoply.BatchSizeTuner(batch_size=100, target_duration=1.0, memory_budget=10000)
+
+        self.assertEqual(tuner.update(100, 0.01), 200)
+        self.assertEqual(tuner.update(200, 4.0), 100)
+        self.assertEqual(tuner.update(100, 0.01, row_bytes=200), 50)
+        tuner.max_memory = 1000
+        self.assertEqual(tuner.update(50, 0.01, memory=2000, memory_growth=500), 25)
+        # memory above the limit, but not growing anymore
+        for _ in range(10):
+            self.assertEqual(tuner.update(25, 0.01, memory=2000, memory_growth=0), 25)
+        self.assertEqual(tuner.update(25, 0.01, memory=900), 50)
+
+    def test_read_batches(self):
+        source = self.MockedDataSource([{"id": i} for i in range(100)])
+        progress = []
+        source.on("progress", progress.append)
+
+        tuner = panoply.BatchSizeTuner(batch_size=10, max_batch_size=40)
+        batches = list(panoply.read_batches(source, tuner))
+
+        self.assertEqual(source.batch_sizes, [10, 20, 40, 40])
+        self.assertEqual(sum(len(batch[0]["data"]) for batch in batches), 100)
+        self.assertEqual([event["batch_size"] for event in progress], [20, 40, 40, 40])
@@ -0,0 +1,50 @@
+import subprocess
+import sys
+import unittest
+
+HEAVY_MODULES = ["requests", "backoff", "paramiko", "sshtunnel", "cryptography"]
+
+
+class TestImports(unittest.TestCase):
+
+    def loaded_modules(self, code):
+        script = f"import sys\n{code}\nprint(' '.join(sorted(sys.modules)))"
+        output = subprocess.check_output([sys.executable, "-c", script])
+        return set(output.decode().split())
+
+    def test_sdk_does_not_import_heavy_modules(self):
+        modules = self.loaded_modules("import panoply\npanoply.SDK")
+
+        for name in HEAVY_MODULES:
+            self.assertNotIn(name, modules)
+
+    def test_ssh_is_imported_on_first_access(self):
+        modules = self.loaded_modules("import panoply\npanoply.SSHTunnel")
+
+        self.assertIn("paramiko", modules)
+        self.assertIn("sshtunnel", modules)
+
+    def test_star_import(self):
+        modules = self.loaded_modules("from panoply import *\nDataSource, SDK, SSHTunnel, to_record")
+
+        self.assertIn("requests", modules)
+
+    def test_public_names(self):
+        # the public API of the package before the lazy imports
+        names = [
+            "DataSource", "FLUSH_TIMEOUT", "Field", "MAXSIZE", "Metadata", "Record", "RecordGroup",
+            "Resource", "SDK", "SSHTunnel", "TokenValidationException", "background_progress",
+            "convert_to_ui_format", "get_iso_string", "normalize_data", "to_record",
+            "validate_resource", "validate_token",
+            "constants", "datasource", "errors", "events", "records", "resources", "sdk", "ssh",
+        ]
+        code = f"import panoply\nfor name in {names!r}:\n    getattr(panoply, name)"
+        subprocess.check_call([sys.executable, "-c", code])
+
+        code = f"from panoply import *\nfor name in {names!r}:\n    assert name in dir(), name"
+        subprocess.check_call([sys.executable, "-c", code])
+
+        modules = self.loaded_modules("from panoply import *\n"
+                                      "assert 'threading' not in dir() and 'custom_excepthook' not in dir()\n"
+                                      "errors.PanoplyException, TokenValidationException")
+        self.assertIn("panoply.errors", modules)
@@ -0,0 +1,78 @@
+import gzip
+import json
+import os
+import tempfile
+import unittest
+
+from panoply import events
+from panoply.load import Loader, read_csv, read_ndjson
+
+
+class MockedSDK(events.Emitter):
+    def __init__(self):
+        super().__init__()
+        self.records = []
+
+    def write(self, table, data, key=None):
+        self.records.append((table, data))
+
+    def flush(self, count):
+        self.fire("flush", {"count": count})
+
+
+class TestLoad(unittest.TestCase):
+
+    RECORDS = [{"id": str(i), "name": f"name\n{i}"} for i in range(5)]
+
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.dir.cleanup()
+
+    def write_file(self, name, content):
+        path = os.path.join(self.dir.name, name)
+        opener = gzip.open if name.endswith(".gz") else open
+        with opener(path, "wb") as f:
+            f.write(content.encode())
+        return path
+
+    def test_read_ndjson(self):
+        content = "".join(json.dumps(record) + "\n" for record in self.RECORDS)
+
+        for name in ["data.ndjson", "data.ndjson.gz"]:
+            path = self.write_file(name, content)
+            offsets, records = zip(*read_ndjson(path))
+            self.assertEqual(list(records), self.RECORDS)
+
+            resumed = [record for _, record in read_ndjson(path, offsets[1])]
+            self.assertEqual(resumed, self.RECORDS[2:])
+
+    def test_read_csv(self):
+        content = "id,name\n" + "".join(f'{r["id"]},"{r["name"]}"\n' for r in self.RECORDS)
+        path = self.write_file("data.csv", content)
+
+        offsets, records = zip(*read_csv(path))
+        self.assertEqual(list(records), self.RECORDS)
+
+        resumed = [record for _, record in read_csv(path, offsets[1])]
+        self.assertEqual(resumed, self.RECORDS[2:])
+
+    def test_offsets_are_committed_on_flush(self):
+        content = "".join(json.dumps(record) + "\n" for record in self.RECORDS)
+        path = self.write_file("data.ndjson", content)
+        line = len(json.dumps(self.RECORDS[0])) + 1
+        sdk = MockedSDK()
+        loader = Loader(sdk, "table")
+
+        loader.load(path)
+        self.assertEqual(len(sdk.records), 5)
+        self.assertEqual(loader.offsets, {})
+
+        sdk.flush(2)
+        self.assertEqual(loader.offsets, {path: 2 * line})
+
+        sdk.fire("error", Exception("failed"))
+        sdk.flush(3)
+        self.assertEqual(loader.offsets, {path: 2 * line})
+        self.assertIsNotNone(loader.error)